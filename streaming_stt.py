@@ -1,111 +1,260 @@
+import asyncio
 import os
-import pyaudio
+# Must be set before PortAudio initialises: lets ALSA convert rate/format in
+# plughw instead of failing or falling back to a higher-latency device.
+os.environ.setdefault("PA_ALSA_PLUGHW", "1")
+import sounddevice as sd
 import psutil
+import queue
+import sys
+import threading
 import time
-from six.moves import queue
 from google.cloud import speech
-import json
+import orjson
 from datetime import datetime
 from collections import deque
 
 # --- Config ---
 RATE = 16000
 CHUNK = int(RATE / 10)  # 100ms chunks
+CHUNKS_PER_CALLBACK = 3  # 300ms per PortAudio callback
+INPUT_LATENCY = "low"  # PortAudio suggested input latency
 TRANSCRIPT_FILE = "live_transcript.txt"
 METRICS_FILE = "resource_log.txt"
+SAMPLE_INTERVAL = 0.05  # 50ms between resource samples
+
+# --- Resource Sampling ---
+_PROCESS = psutil.Process()
+_TOTAL_RAM = psutil.virtual_memory().total
+_BYTES_TO_MB = 1.0 / (1024 * 1024)
+
+# Latest (cpu %, rss MB, ram %) snapshot. Single writer: the sampler task
+# swaps in a whole tuple, so readers never see a partial update.
+_snapshot = [(0.0, 0.0, 0.0)]
+
+async def _sample_resources():
+    _PROCESS.cpu_percent(interval=None)  # init CPU tracking
+    while True:
+        await asyncio.sleep(SAMPLE_INTERVAL)
+        with _PROCESS.oneshot():
+            cpu = _PROCESS.cpu_percent(interval=None)
+            rss = _PROCESS.memory_info().rss
+        _snapshot[0] = (cpu, rss * _BYTES_TO_MB, 100.0 * rss / _TOTAL_RAM)
+
+RING_CHUNKS = 32  # audio chunks the ring buffer can hold before overflowing
+
+# --- Audio Ring Buffer ---
+class RingBuffer:
+    """Single-producer/single-consumer byte ring buffer.
+
+    Only the producer advances ``_head`` and only the consumer advances
+    ``_tail``, so neither side needs a lock. Indices grow without bound and
+    are masked into the power-of-two sized storage.
+    """
+
+    def __init__(self, min_size):
+        size = 1 << (min_size - 1).bit_length()
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._mask = size - 1
+        self._head = 0
+        self._tail = 0
+        self.overflows = 0
+
+    def push(self, data):
+        data = memoryview(data)
+        n = len(data)
+        head = self._head
+        if n > len(self._buf) - (head - self._tail):
+            self.overflows += 1
+            return
+        start = head & self._mask
+        first = min(n, len(self._buf) - start)
+        self._view[start:start + first] = data[:first]
+        self._view[:n - first] = data[first:]
+        self._head = head + n
+
+    def pop(self):
+        tail = self._tail
+        n = self._head - tail
+        if not n:
+            return b""
+        start = tail & self._mask
+        first = min(n, len(self._buf) - start)
+        if first < n:
+            # Wrapped: join both views so the bytes are copied exactly once.
+            data = b"".join((self._view[start:], self._view[:n - first]))
+        else:
+            data = bytes(self._view[start:start + n])
+        self._tail = tail + n
+        return data
 
 # --- Streaming Setup ---
 class MicrophoneStream:
     def __init__(self, rate, chunk):
         self.rate = rate
         self.chunk = chunk
-        self._buff = queue.Queue()
+        self._buff = RingBuffer(chunk * 2 * RING_CHUNKS)  # 16-bit samples
+        self.input_overflows = 0
         self.closed = True
 
+    @property
+    def ring_overflows(self):
+        return self._buff.overflows
+
     def __enter__(self):
-        self.audio_interface = pyaudio.PyAudio()
-        self.audio_stream = self.audio_interface.open(
-            format=pyaudio.paInt16,
+        self._loop = asyncio.get_running_loop()
+        self._data_ready = asyncio.Event()
+        self.audio_stream = sd.RawInputStream(
+            samplerate=self.rate,
+            blocksize=self.chunk * CHUNKS_PER_CALLBACK,
+            dtype="int16",
             channels=1,
-            rate=self.rate,
-            input=True,
-            frames_per_buffer=self.chunk,
-            stream_callback=self._fill_buffer,
+            latency=INPUT_LATENCY,
+            callback=self._fill_buffer,
         )
+        self.audio_stream.start()
         self.closed = False
         return self
 
     def __exit__(self, type, value, traceback):
-        self.audio_stream.stop_stream()
+        self.audio_stream.stop()
         self.audio_stream.close()
         self.closed = True
-        self._buff.put(None)
-        self.audio_interface.terminate()
+        self._data_ready.set()
 
-    def _fill_buffer(self, in_data, frame_count, time_info, status_flags):
-        self._buff.put(in_data)
-        return None, pyaudio.paContinue
+    def _fill_buffer(self, in_data, frame_count, time_info, status):
+        if status.input_overflow:
+            self.input_overflows += 1
+        self._buff.push(in_data)
+        # The audio itself goes through the lock-free ring; only the wakeup
+        # (once per callback) crosses into the event loop.
+        self._loop.call_soon_threadsafe(self._data_ready.set)
 
-    def generator(self):
+    async def generator(self):
         while not self.closed:
-            chunk = self._buff.get()
-            if chunk is None:
-                return
-            data = [chunk]
-            while True:
-                try:
-                    chunk = self._buff.get_nowait()
-                    if chunk is None:
-                        return
-                    data.append(chunk)
-                except queue.Empty:
-                    break
-            yield b"".join(data)
+            data = self._buff.pop()
+            if not data:
+                await self._data_ready.wait()
+                self._data_ready.clear()
+                continue
+            yield data
+
+# --- Console Output ---
+_INTERIM_PREFIX = "⏳ Interim: ".encode("utf-8")
+_FINAL_PREFIX = "✅ Final: ".encode("utf-8")
+
+def _drain_output(out_q):
+    out = sys.stdout.buffer
+    for line in iter(out_q.get, None):
+        out.write(line)
+        out.flush()
 
 # --- Processing Loop ---
-def listen_print_loop(responses, output_file=TRANSCRIPT_FILE):
-    process = psutil.Process()
-    process.cpu_percent(interval=None)  # init CPU tracking
+async def listen_print_loop(responses, stream, output_file=TRANSCRIPT_FILE):
+    sampler = asyncio.create_task(_sample_resources())
+
+    # Terminal writes happen off the response thread; None stops the printer.
+    out_q = queue.SimpleQueue()
+    printer = threading.Thread(target=_drain_output, args=(out_q,), daemon=True)
+    printer.start()
+
+    # Running totals keep session-wide averages in O(1) memory.
+    cpu_total = 0.0
+    ram_total = 0.0
+    sample_count = 0
+    latency_total = 0.0
+    final_count = 0
+    peak_memory_mb = 0.0
+    next_sample_ts = 0.0
+    last_interim = None
 
-    session_start = time.time()
+    session_start = time.monotonic()
 
-    print(f"\n📝 Writing transcript to: {output_file}")
-    with open(output_file, "w") as f, open(METRICS_FILE, "w") as log:
+    print(f"\n📝 Writing transcript to: {output_file}", flush=True)
+    with open(output_file, "w", buffering=1, encoding="utf-8") as f, \
+            open(METRICS_FILE, "wb", buffering=0) as log:
         try:
-            for response in responses:
-                if not response.results:
+            async for response in responses:
+                cpu, memory_mb, ram = _snapshot[0]
+                sample_ts = time.monotonic()
+                if sample_ts >= next_sample_ts:
+                    cpu_total += cpu
+                    ram_total += ram
+                    sample_count += 1
+                    peak_memory_mb = max(peak_memory_mb, memory_mb)
+                    next_sample_ts = sample_ts + SAMPLE_INTERVAL
+
+                # Read the raw protobuf to skip proto-plus attribute wrapping.
+                results = response._pb.results
+                if not results:
                     continue
 
-                result = response.results[0]
-                if not result.alternatives:
+                result = results[0]
+                alternatives = result.alternatives
+                if not alternatives:
                     continue
 
-                transcript = result.alternatives[0].transcript
+                transcript = alternatives[0].transcript
+                is_final = result.is_final
+
+                # Unstable interim results often repeat; don't redraw them.
+                if not is_final and transcript == last_interim:
+                    continue
 
-                if result.is_final:
-                    now = time.time()
-                    audio_duration = result.result_end_time.total_seconds()
+                if is_final:
+                    now = time.monotonic()
+                    audio_duration = result.result_end_time.ToNanoseconds() * 1e-9
                     latency = now - (session_start + audio_duration)
-                    cpu = process.cpu_percent(interval=None)
+                    latency_total += latency
+                    final_count += 1
 
-                    print(f"✅ Final: {transcript}")
+                    out_q.put(_FINAL_PREFIX + transcript.encode("utf-8") + b"\n")
                     f.write(transcript + "\n")
-                    f.flush()
 
-                    log.write(json.dumps({
-                        "latency": round(latency, 2),
-                        "cpu": round(cpu, 2)
-                    }) + "\n")
-                    log.flush()
+                    log.write(orjson.dumps({
+                        "latency": latency,
+                        "cpu": cpu,
+                    }, option=orjson.OPT_APPEND_NEWLINE))
+                    last_interim = None
                 else:
-                    print(f"⏳ Interim: {transcript}", end="\r")
+                    out_q.put(_INTERIM_PREFIX + transcript.encode("utf-8") + b"\r")
+                    last_interim = transcript
+
+        finally:
+            sampler.cancel()
+            out_q.put(None)
+            printer.join()
+            log.write(orjson.dumps({
+                "avg_latency": latency_total / final_count if final_count else None,
+                "avg_cpu": cpu_total / sample_count if sample_count else None,
+                "avg_ram": ram_total / sample_count if sample_count else None,
+                "peak_memory_mb": peak_memory_mb,
+                "ring_overflows": stream.ring_overflows,
+                "input_overflows": stream.input_overflows,
+            }, option=orjson.OPT_APPEND_NEWLINE))
+            for fh in (f, log):
+                fh.flush()
+                os.fsync(fh.fileno())
+
+# --- Request Feeding ---
+_StreamingRequest = speech.StreamingRecognizeRequest
+_StreamingRequestPb = _StreamingRequest.pb()
 
-        except KeyboardInterrupt:
-            print("\n⛔ Transcription stopped by user.")
+def _audio_request(content):
+    # Build the raw protobuf and wrap it without copying: the client only
+    # serializes proto-plus messages, but wrap() skips their field marshalling.
+    return _StreamingRequest.wrap(_StreamingRequestPb(audio_content=content))
+
+async def _request_stream(streaming_config, audio_generator):
+    # The async client has no config helper, so the config goes out first.
+    yield _StreamingRequest(streaming_config=streaming_config)
+    async for content in audio_generator:
+        yield _audio_request(content)
 
 # --- Main Execution ---
-def main():
-    client = speech.SpeechClient()
+async def main():
+    client = speech.SpeechAsyncClient()
 
     config = speech.RecognitionConfig(
         encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
@@ -120,12 +269,12 @@ def main():
 
     with MicrophoneStream(RATE, CHUNK) as stream:
         audio_generator = stream.generator()
-        requests = (
-            speech.StreamingRecognizeRequest(audio_content=content)
-            for content in audio_generator
-        )
-        responses = client.streaming_recognize(streaming_config, requests)
-        listen_print_loop(responses)
+        requests = _request_stream(streaming_config, audio_generator)
+        responses = await client.streaming_recognize(requests=requests)
+        await listen_print_loop(responses, stream)
 
 if __name__ == "__main__":
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n⛔ Transcription stopped by user.")